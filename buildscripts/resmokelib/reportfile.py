@@ -4,8 +4,6 @@ Manages interactions with the report.json file.
 
 from __future__ import absolute_import
 
-import json
-
 from . import config
 from .testing import report as _report
 
@@ -19,10 +17,16 @@ def write(suites):
     if config.REPORT_FILE is None:
         return
 
-    reports = []
-    for suite in suites:
-        reports.extend(suite.get_reports())
-
-    combined_report_dict = _report.TestReport.combine(*reports).as_dict(convert_failures=True)
-    with open(config.REPORT_FILE, "w") as fp:
-        json.dump(combined_report_dict, fp)
+    # Combine and stream one suite at a time so that peak memory is bounded by the largest
+    # suite's report rather than by the whole run. Use a large buffer so the many small writes
+    # made while streaming the report are batched into few system calls.
+    num_failures = 0
+    first = True
+    with open(config.REPORT_FILE, "wb", buffering=1 << 20) as fp:
+        fp.write('{"results": [')
+        for suite in suites:
+            combined_report = _report.TestReport.combine(*suite.get_reports())
+            first = combined_report._stream_results(fp, first, convert_failures=True)
+            num_failures += (combined_report.num_failed + combined_report.num_errored
+                             + combined_report.num_interrupted)
+        fp.write('], "failures": %d}' % (num_failures))
@@ -5,14 +5,46 @@ and timing information for the report.json file.
 
 from __future__ import absolute_import
 
-import copy
+import collections
+import json
 import threading
 import time
 import unittest
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from .. import config as _config
 from .. import logging
 
+if orjson is not None:
+    _dumps = orjson.dumps
+else:
+    def _dumps(obj):
+        # Compact separators shrink the machine-read report.json; ensure_ascii stays enabled so
+        # the encoder always returns a byte string that can be written to the binary report file.
+        return json.dumps(obj, separators=(",", ":"))
+
+# The test statuses are interned so the hot filters can compare them by identity. Statuses read
+# back from a report.json file must go through intern() (see from_dict()) for this to hold.
+_PASS = intern("pass")
+_FAIL = intern("fail")
+_SILENTFAIL = intern("silentfail")
+_ERROR = intern("error")
+_TIMEOUT = intern("timeout")
+
+# Status substitutions applied to dynamic tests when writing the report.json file. Dynamic tests
+# are used for data consistency checks, so their failures are not silenced.
+_DYNAMIC_STATUS_REMAP = {_ERROR: _FAIL, _FAIL: _FAIL, _TIMEOUT: _FAIL}
+
+# The statuses that count towards 'num_failed'.
+_FAILED_STATUSES = frozenset([_FAIL, _SILENTFAIL])
+
+# Cached to avoid the module attribute lookup in the per-test methods.
+_time = time.time
+
 
 class TestReport(unittest.TestResult):
     """
@@ -30,6 +62,11 @@ class TestReport(unittest.TestResult):
 
         self._lock = threading.Lock()
 
+        # The test info most recently started by each job thread. startTest() and the
+        # stopTest()/addXX() calls for a test all happen on the thread running it, so this gives
+        # _find_test_info() a lookup that doesn't depend on the test id at all.
+        self._tls = threading.local()
+
         self.reset()
 
     @classmethod
@@ -46,41 +83,58 @@ class TestReport(unittest.TestResult):
         # TestReports that are used when running tests need a JobLogger but combined reports don't
         # use the logger.
         combined_report = cls(logging.loggers.EXECUTOR_LOGGER)
-        combining_time = time.time()
+        combining_time = _time()
 
         for report in reports:
             if not isinstance(report, TestReport):
                 raise TypeError("reports must be a list of TestReport instances")
 
             with report._lock:
+                to_add = []
                 for test_info in report.test_infos:
                     # If the user triggers a KeyboardInterrupt exception while a test is running,
                     # then it is possible for 'test_info' to be modified by a job thread later on.
-                    # We make a shallow copy in order to ensure 'num_interrupted' is consistent with
-                    # the actual number of tests that have status equal to "timeout".
-                    test_info = copy.copy(test_info)
-
-                    # TestReport.addXX() may not have been called.
-                    if test_info.status is None or test_info.return_code is None:
-                        # Mark the test as having timed out if it was interrupted. It might have
-                        # passed if the suite ran to completion, but we wouldn't know for sure.
-                        test_info.status = "timeout"
-                        test_info.return_code = -2
-
-                    # TestReport.stopTest() may not have been called.
-                    if test_info.end_time is None:
-                        # Use the current time as the time that the test finished running.
-                        test_info.end_time = combining_time
-
-                    combined_report.test_infos.append(test_info)
-
+                    # We snapshot the mutable fields while holding the lock in order to ensure
+                    # 'num_interrupted' is consistent with the actual number of tests that have
+                    # status equal to "timeout".
+                    status = test_info.status
+                    return_code = test_info.return_code
+                    end_time = test_info.end_time
+
+                    if status is None or return_code is None or end_time is None:
+                        # The test hadn't finished running, so record the snapshot in a separate
+                        # _TestInfo instance rather than modifying the original one.
+                        snapshot = _TestInfo(test_info.test_id, test_info.dynamic)
+                        snapshot.start_time = test_info.start_time
+                        snapshot.url_endpoint = test_info.url_endpoint
+
+                        # TestReport.addXX() may not have been called.
+                        if status is None or return_code is None:
+                            # Mark the test as having timed out if it was interrupted. It might
+                            # have passed if the suite ran to completion, but we wouldn't know for
+                            # sure.
+                            status = _TIMEOUT
+                            return_code = -2
+
+                        # TestReport.stopTest() may not have been called.
+                        if end_time is None:
+                            # Use the current time as the time that the test finished running.
+                            end_time = combining_time
+
+                        snapshot.status = status
+                        snapshot.return_code = return_code
+                        snapshot.end_time = end_time
+                        test_info = snapshot
+
+                    to_add.append(test_info)
+
+                combined_report.test_infos.extend(to_add)
+                combined_report._test_info_by_id.update(
+                    (test_info.test_id, test_info) for test_info in to_add)
                 combined_report.num_dynamic += report.num_dynamic
 
         # Recompute number of success, failures, and errors.
-        combined_report.num_succeeded = len(combined_report.get_successful())
-        combined_report.num_failed = len(combined_report.get_failed())
-        combined_report.num_errored = len(combined_report.get_errored())
-        combined_report.num_interrupted = len(combined_report.get_interrupted())
+        combined_report._recount()
 
         return combined_report
 
@@ -92,7 +146,8 @@ class TestReport(unittest.TestResult):
         unittest.TestResult.startTest(self, test)
 
         test_info = _TestInfo(test.id(), dynamic)
-        test_info.start_time = time.time()
+        test_info.start_time = _time()
+        self._tls.active_test_info = test_info
 
         basename = test.basename()
         if dynamic:
@@ -101,16 +156,18 @@ class TestReport(unittest.TestResult):
             command = test.as_command()
         self.job_logger.info("Running %s...\n%s", basename, command)
 
+        # Set up the test-specific logger before publishing 'test_info', so that the lock is only
+        # held for the report-state mutations and the info is fully populated once it is visible.
+        test_logger = self.job_logger.new_test_logger(test.short_name(), test.basename(),
+                                                      command, test.logger)
+        test_info.url_endpoint = test_logger.url_endpoint
+
         with self._lock:
             self.test_infos.append(test_info)
+            self._test_info_by_id[test_info.test_id] = test_info
             if dynamic:
                 self.num_dynamic += 1
 
-        # Set up the test-specific logger.
-        test_logger = self.job_logger.new_test_logger(test.short_name(), test.basename(),
-                                                      command, test.logger)
-        test_info.url_endpoint = test_logger.url_endpoint
-
         # TestReport.combine() doesn't access the '__original_loggers' attribute, so we don't bother
         # protecting it with the lock.
         self.__original_loggers[test_info.test_id] = test.logger
@@ -125,7 +182,11 @@ class TestReport(unittest.TestResult):
 
         with self._lock:
             test_info = self._find_test_info(test)
-            test_info.end_time = time.time()
+            test_info.end_time = _time()
+
+        # The test is no longer running on this thread; later calls like setFailure() fall back to
+        # the id lookup in _find_test_info().
+        self._tls.active_test_info = None
 
         time_taken = test_info.end_time - test_info.start_time
         self.job_logger.info("%s ran in %0.2f seconds.", test.basename(), time_taken)
@@ -152,10 +213,9 @@ class TestReport(unittest.TestResult):
         unittest.TestResult.addError(self, test, err)
 
         with self._lock:
-            self.num_errored += 1
-
             test_info = self._find_test_info(test)
-            test_info.status = "error"
+            self._status_delta(test_info.status, _ERROR)
+            test_info.status = _ERROR
             test_info.return_code = test.return_code
 
     def setError(self, test):
@@ -168,15 +228,10 @@ class TestReport(unittest.TestResult):
             if test_info.end_time is None:
                 raise ValueError("stopTest was not called on %s" % (test.basename()))
 
-            test_info.status = "error"
+            self._status_delta(test_info.status, _ERROR)
+            test_info.status = _ERROR
             test_info.return_code = 2
 
-        # Recompute number of success, failures, and errors.
-        self.num_succeeded = len(self.get_successful())
-        self.num_failed = len(self.get_failed())
-        self.num_errored = len(self.get_errored())
-        self.num_interrupted = len(self.get_interrupted())
-
     def addFailure(self, test, err):
         """
         Called when a failureException was raised during the execution
@@ -186,10 +241,9 @@ class TestReport(unittest.TestResult):
         unittest.TestResult.addFailure(self, test, err)
 
         with self._lock:
-            self.num_failed += 1
-
             test_info = self._find_test_info(test)
-            test_info.status = "fail"
+            self._status_delta(test_info.status, _FAIL)
+            test_info.status = _FAIL
             test_info.return_code = test.return_code
 
     def setFailure(self, test, return_code=1):
@@ -202,15 +256,10 @@ class TestReport(unittest.TestResult):
             if test_info.end_time is None:
                 raise ValueError("stopTest was not called on %s" % (test.basename()))
 
-            test_info.status = "fail"
+            self._status_delta(test_info.status, _FAIL)
+            test_info.status = _FAIL
             test_info.return_code = return_code
 
-        # Recompute number of success, failures, and errors.
-        self.num_succeeded = len(self.get_successful())
-        self.num_failed = len(self.get_failed())
-        self.num_errored = len(self.get_errored())
-        self.num_interrupted = len(self.get_interrupted())
-
     def addSuccess(self, test):
         """
         Called when 'test' executed successfully.
@@ -219,10 +268,9 @@ class TestReport(unittest.TestResult):
         unittest.TestResult.addSuccess(self, test)
 
         with self._lock:
-            self.num_succeeded += 1
-
             test_info = self._find_test_info(test)
-            test_info.status = "pass"
+            self._status_delta(test_info.status, _PASS)
+            test_info.status = _PASS
             test_info.return_code = test.return_code
 
     def wasSuccessful(self):
@@ -239,8 +287,8 @@ class TestReport(unittest.TestResult):
         executed successfully.
         """
 
-        with self._lock:
-            return [test_info for test_info in self.test_infos if test_info.status == "pass"]
+        return [test_info for test_info in self._snapshot_test_infos()
+                if test_info.status is _PASS]
 
     def get_failed(self):
         """
@@ -248,9 +296,8 @@ class TestReport(unittest.TestResult):
         raised a failureException during their execution.
         """
 
-        with self._lock:
-            return [test_info for test_info in self.test_infos
-                    if test_info.status in ("fail", "silentfail")]
+        return [test_info for test_info in self._snapshot_test_infos()
+                if test_info.status in _FAILED_STATUSES]
 
     def get_errored(self):
         """
@@ -258,8 +305,8 @@ class TestReport(unittest.TestResult):
         raised a non-failureException during their execution.
         """
 
-        with self._lock:
-            return [test_info for test_info in self.test_infos if test_info.status == "error"]
+        return [test_info for test_info in self._snapshot_test_infos()
+                if test_info.status is _ERROR]
 
     def get_interrupted(self):
         """
@@ -267,8 +314,8 @@ class TestReport(unittest.TestResult):
         their execution interrupted.
         """
 
-        with self._lock:
-            return [test_info for test_info in self.test_infos if test_info.status == "timeout"]
+        return [test_info for test_info in self._snapshot_test_infos()
+                if test_info.status is _TIMEOUT]
 
     def as_dict(self, convert_failures=False):
         """
@@ -280,47 +327,119 @@ class TestReport(unittest.TestResult):
         _config.REPORT_FAILURE_STATUS in the returned dictionary.
         """
 
-        results = []
         with self._lock:
-            for test_info in self.test_infos:
-                status = test_info.status
-                if convert_failures:
-                    if status == "error" or status == "fail":
-                        # Don't distinguish between failures and errors.
-                        if test_info.dynamic:
-                            # Dynamic tests are used for data consistency checks, so the failures
-                            # are not silenced.
-                            status = "fail"
-                        else:
-                            status = _config.REPORT_FAILURE_STATUS
-                    elif status == "timeout":
-                        # Until EVG-1536 is completed, we shouldn't distinguish between failures and
-                        # interrupted tests in the report.json file. In Evergreen, the behavior to
-                        # sort tests with the "timeout" test status after tests with the "pass" test
-                        # status effectively hides interrupted tests from the test results sidebar
-                        # unless sorting by the time taken.
-                        status = "fail"
-
-                result = {
-                    "test_file": test_info.test_id,
-                    "status": status,
-                    "exit_code": test_info.return_code,
-                    "start": test_info.start_time,
-                    "end": test_info.end_time,
-                    "elapsed": test_info.end_time - test_info.start_time,
-                }
-
-                if test_info.url_endpoint is not None:
-                    result["url"] = test_info.url_endpoint
-                    result["url_raw"] = test_info.url_endpoint + "?raw=1"
-
-                results.append(result)
+            test_infos = list(self.test_infos)
+            num_failures = self.num_failed + self.num_errored + self.num_interrupted
+
+        # The result dictionaries are built without holding the lock so that job threads aren't
+        # blocked for the entire serialization. A _TestInfo is only mutated by the job thread
+        # running that test, and reports are serialized after their job threads have finished.
+        status_remap = self._convert_status_remap() if convert_failures else None
+        results = [self._result_as_dict(test_info, status_remap) for test_info in test_infos]
+
+        return {
+            "results": results,
+            "failures": num_failures,
+        }
+
+    def write_json(self, fp, convert_failures=False):
+        """
+        Writes the same JSON document as_dict() describes directly to 'fp'
+        without materializing the full list of result dictionaries.
+
+        Used to create the report.json file. 'fp' must be opened in binary
+        mode when orjson is available, since orjson encodes to bytes.
+        """
+
+        with self._lock:
+            num_failures = self.num_failed + self.num_errored + self.num_interrupted
+
+        fp.write('{"results": [')
+        self._stream_results(fp, True, convert_failures=convert_failures)
+        fp.write('], "failures": %d}' % (num_failures))
+
+    def _stream_results(self, fp, first, convert_failures=False):
+        """
+        Writes this report's results to 'fp' as elements of an already-open
+        JSON array.
+
+        'first' indicates whether the array is still empty, and the updated
+        value is returned so that results from multiple reports can be
+        streamed into the same array.
+        """
+
+        with self._lock:
+            test_infos = list(self.test_infos)
+
+        # See the comment in as_dict() for why iterating without the lock is safe here.
+        status_remap = self._convert_status_remap() if convert_failures else None
+        for test_info in test_infos:
+            if not first:
+                fp.write(",")
+            first = False
+            fp.write(_dumps(self._result_as_dict(test_info, status_remap)))
+
+        return first
+
+    def _convert_status_remap(self):
+        """
+        Returns the status substitutions to apply to non-dynamic tests when
+        writing the report.json file, as a dictionary mapping the recorded
+        status to the reported one.
+        """
+
+        # Don't distinguish between failures and errors. Additionally, until EVG-1536 is
+        # completed, we shouldn't distinguish between failures and interrupted tests in the
+        # report.json file. In Evergreen, the behavior to sort tests with the "timeout" test
+        # status after tests with the "pass" test status effectively hides interrupted tests from
+        # the test results sidebar unless sorting by the time taken.
+        failure_status = _config.REPORT_FAILURE_STATUS
+        return {
+            _ERROR: failure_status,
+            _FAIL: failure_status,
+            _TIMEOUT: _FAIL,
+        }
+
+    def _result_as_dict(self, test_info, status_remap):
+        """
+        Returns the report.json entry for 'test_info'.
+
+        'status_remap' is either None or the dictionary of status
+        substitutions returned by _convert_status_remap().
+        """
+
+        status = test_info.status
+        if status_remap is not None:
+            if test_info.dynamic:
+                status = _DYNAMIC_STATUS_REMAP.get(status, status)
+            else:
+                status = status_remap.get(status, status)
 
+        start_time = test_info.start_time
+        end_time = test_info.end_time
+        url_endpoint = test_info.url_endpoint
+
+        if url_endpoint is None:
             return {
-                "results": results,
-                "failures": self.num_failed + self.num_errored + self.num_interrupted,
+                "test_file": test_info.test_id,
+                "status": status,
+                "exit_code": test_info.return_code,
+                "start": start_time,
+                "end": end_time,
+                "elapsed": end_time - start_time,
             }
 
+        return {
+            "test_file": test_info.test_id,
+            "status": status,
+            "exit_code": test_info.return_code,
+            "start": start_time,
+            "end": end_time,
+            "elapsed": end_time - start_time,
+            "url": url_endpoint,
+            "url_raw": url_endpoint + "?raw=1",
+        }
+
     @classmethod
     def from_dict(cls, report_dict):
         """
@@ -335,20 +454,20 @@ class TestReport(unittest.TestResult):
             is_dynamic = ":" in result["test_file"]
             test_info = _TestInfo(result["test_file"], is_dynamic)
             test_info.url_endpoint = result.get("url")
-            test_info.status = result["status"]
+            # The JSON decoder returns a fresh (unicode) string, so route it through intern() to
+            # restore the identity-comparison property of the module's status constants.
+            test_info.status = intern(str(result["status"]))
             test_info.return_code = result["exit_code"]
             test_info.start_time = result["start"]
             test_info.end_time = result["end"]
             report.test_infos.append(test_info)
+            report._test_info_by_id[test_info.test_id] = test_info
 
             if is_dynamic:
                 report.num_dynamic += 1
 
         # Update cached values for number of successful and failed tests.
-        report.num_failed = len(report.get_failed())
-        report.num_errored = len(report.get_errored())
-        report.num_interrupted = len(report.get_interrupted())
-        report.num_succeeded = len(report.get_successful())
+        report._recount()
 
         return report
 
@@ -359,6 +478,7 @@ class TestReport(unittest.TestResult):
 
         with self._lock:
             self.test_infos = []
+            self._test_info_by_id = {}
 
             self.num_dynamic = 0
             self.num_succeeded = 0
@@ -370,28 +490,81 @@ class TestReport(unittest.TestResult):
         # protecting it with the lock.
         self.__original_loggers = {}
 
+    def _snapshot_test_infos(self):
+        """
+        Returns a copy of the list of test infos so that it can be
+        iterated over without holding the lock.
+        """
+
+        with self._lock:
+            return list(self.test_infos)
+
+    def _status_delta(self, old_status, new_status):
+        """
+        Adjusts the cached status counters for a test transitioning from
+        'old_status' to 'new_status'.
+
+        Must be called while holding the lock.
+        """
+
+        for (status, delta) in ((old_status, -1), (new_status, 1)):
+            if status is _PASS:
+                self.num_succeeded += delta
+            elif status in _FAILED_STATUSES:
+                self.num_failed += delta
+            elif status is _ERROR:
+                self.num_errored += delta
+            elif status is _TIMEOUT:
+                self.num_interrupted += delta
+
+    def _recount(self):
+        """
+        Recomputes the number of successful, failed, errored, and
+        interrupted tests in a single pass over 'test_infos'.
+        """
+
+        with self._lock:
+            counts = collections.Counter(test_info.status for test_info in self.test_infos)
+            self.num_succeeded = counts[_PASS]
+            self.num_failed = counts[_FAIL] + counts[_SILENTFAIL]
+            self.num_errored = counts[_ERROR]
+            self.num_interrupted = counts[_TIMEOUT]
+
     def _find_test_info(self, test):
         """
         Returns the status and timing information associated with
         'test'.
         """
 
-        test_id = test.id()
+        # The test currently running on this thread is the overwhelmingly common lookup, so try
+        # the thread-local reference before hashing the test id.
+        test_info = getattr(self._tls, "active_test_info", None)
+        if test_info is not None and test_info.test_id == test.id():
+            return test_info
 
-        # Search the list backwards to efficiently find the status and timing information of a test
-        # that was recently started.
-        for test_info in reversed(self.test_infos):
-            if test_info.test_id == test_id:
-                return test_info
+        # If the same test is started multiple times, then the dictionary holds the most recently
+        # started instance, which matches the reverse list scan this lookup replaced.
+        test_info = self._test_info_by_id.get(test.id())
+        if test_info is None:
+            raise ValueError("Details for %s not found in the report" % (test.basename()))
 
-        raise ValueError("Details for %s not found in the report" % (test.basename()))
+        return test_info
 
 
 class _TestInfo(object):
     """
     Holder for the test status and timing information.
+
+    Instances are exposed through TestReport.test_infos and mutated in place
+    by external consumers (e.g. promote_silent_failures.py), so the report
+    must store real objects rather than a column-oriented copy of their
+    fields.
     """
 
+    # An instance is created for every test that runs, so avoid the per-instance __dict__.
+    __slots__ = ("test_id", "dynamic", "start_time", "end_time", "status", "return_code",
+                 "url_endpoint")
+
     def __init__(self, test_id, dynamic):
         """
         Initializes the _TestInfo instance.